@@ -1,24 +1,40 @@
 import os
 import cv2
 import easyocr
+import torch
 import numpy as np
-import pandas as pd
-import random
+import threading
+import orjson
 from flask import Flask, request, jsonify
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 
-from parser import clean_ocr_lines, parse_prescription
+from parser import clean_ocr_lines, parse_prescription, med_df
+
+# ---------------------------------------------------
+# JSON PROVIDER (orjson)
+# ---------------------------------------------------
+class ORJSONProvider(JSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 
 # ---------------------------------------------------
 # INITIALIZE APP
 # ---------------------------------------------------
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 CORS(app)
 
 # ---------------------------------------------------
-# LOAD MEDICINE DATABASE
+# LOAD OCR MODEL (once, shared across requests)
 # ---------------------------------------------------
-med_df = pd.read_csv("med_list.csv")   # MUST EXIST
+gpu = torch.cuda.is_available()
+READER = easyocr.Reader(['en'], gpu=gpu)
+_lock = threading.Lock()
 
 
 # ---------------------------------------------------
@@ -33,15 +49,21 @@ def handle_exception(e):
 # ---------------------------------------------------
 # IMAGE PREPROCESS
 # ---------------------------------------------------
-def preprocess(img_path):
+def preprocess(img_bytes):
     print("[1] Preprocessing image...")
 
-    img = cv2.imread(img_path)
-    if img is None:
+    data = np.frombuffer(img_bytes, dtype=np.uint8)
+    gray = cv2.imdecode(data, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
         raise ValueError("Image file not found or unreadable")
 
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    gray = cv2.fastNlMeansDenoising(gray, h=25)
+    gray = cv2.medianBlur(gray, 3)
+
+    # Only upscale small images, up to a ~1600px long edge
+    h, w = gray.shape[:2]
+    scale = max(1.0, 1600 / max(h, w))
+    if scale > 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
 
     thresh = cv2.adaptiveThreshold(
         gray, 255,
@@ -49,21 +71,17 @@ def preprocess(img_path):
         cv2.THRESH_BINARY, 31, 3
     )
 
-    thresh = cv2.resize(thresh, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
-    out_path = "processed.png"
-    cv2.imwrite(out_path, thresh)
-
-    return out_path
+    return thresh
 
 
 # ---------------------------------------------------
 # OCR STEP
 # ---------------------------------------------------
-def run_ocr(img_path):
+def run_ocr(img):
     print("[2] Running OCR...")
 
-    reader = easyocr.Reader(['en'], gpu=False)
-    result = reader.readtext(img_path, detail=0)
+    with _lock:
+        result = READER.readtext(img, detail=0)
 
     print("[DEBUG RAW OCR]:", result)
     return result
@@ -73,22 +91,23 @@ def run_ocr(img_path):
 # COST SAVING CALCULATION
 # ---------------------------------------------------
 def calculate_savings(meds):
-    random.seed(42)  # deterministic multiplier
+    rng = np.random.default_rng(42)  # deterministic multiplier
 
-    total_generic = 0
-    total_brand = 0
+    generic = np.fromiter((float(m["price"]) for m in meds), dtype=np.float64, count=len(meds))
+    brand = generic * rng.uniform(2.0, 3.0, size=generic.size)
+    savings = brand - generic
 
-    for m in meds:
-        generic_price = float(m["price"])
-        multiplier = random.uniform(2, 3)
-        brand_estimated = generic_price * multiplier
+    generic_r = np.round(generic, 2).tolist()
+    brand_r = np.round(brand, 2).tolist()
+    savings_r = np.round(savings, 2).tolist()
 
-        m["generic_price"] = round(generic_price, 2)
-        m["brand_estimated_price"] = round(brand_estimated, 2)
-        m["savings"] = round(brand_estimated - generic_price, 2)
+    for m, g, b, s in zip(meds, generic_r, brand_r, savings_r):
+        m["generic_price"] = g
+        m["brand_estimated_price"] = b
+        m["savings"] = s
 
-        total_generic += generic_price
-        total_brand += brand_estimated
+    total_generic = float(generic.sum())
+    total_brand = float(brand.sum())
 
     return {
         "total_generic_cost": round(total_generic, 2),
@@ -107,10 +126,11 @@ def analyze():
             return jsonify({"error": "No file uploaded"}), 400
 
         file = request.files["file"]
-        img_path = "upload_tmp.jpg"
-        file.save(img_path)
+        img_bytes = file.read()
+        if not img_bytes:
+            return jsonify({"error": "Image file not found or unreadable"}), 400
 
-        processed = preprocess(img_path)
+        processed = preprocess(img_bytes)
         raw_lines = run_ocr(processed)
 
         print("[3] Cleaning OCR...")
@@ -180,8 +200,8 @@ def search_medicine():
 
     try:
         mask = (
-            med_df["brand"].astype(str).str.lower().str.contains(query, na=False) |
-            med_df["generic"].astype(str).str.lower().str.contains(query, na=False)
+            med_df["_brand_lc"].str.contains(query, na=False, regex=False) |
+            med_df["_generic_lc"].str.contains(query, na=False, regex=False)
         )
 
         results = med_df[mask][["brand", "generic", "price"]].to_dict(orient="records")
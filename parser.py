@@ -1,66 +1,141 @@
+import os
 import re
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
-import random
 from rapidfuzz import process, fuzz
 
 # ============================================================
 # LOAD MED LIST
 # ============================================================
-med_df = pd.read_csv("med_list.csv")
-canon_names = med_df["brand"].str.lower().tolist()
+MED_CSV = "med_list.csv"
+MED_CACHE = "med_list.pkl"
+
+
+def load_meds(csv_path=MED_CSV, cache_path=MED_CACHE):
+    # Reuse the pickled DataFrame unless the CSV is newer than the cache
+    # (a corrupt or incompatible cache falls back to the CSV)
+    try:
+        if os.path.getmtime(cache_path) >= os.path.getmtime(csv_path):
+            with open(cache_path, "rb") as f:
+                df, names = pickle.load(f)
+            return df, names
+    except FileNotFoundError:
+        pass
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError,
+            ImportError, ValueError, TypeError) as e:
+        print("⚠️ Ignoring unreadable med cache:", e)
+
+    df = pd.read_csv(csv_path)
+    df["_brand_lc"] = df["brand"].astype(str).str.lower()
+    df["_generic_lc"] = df["generic"].astype(str).str.lower()
+    names = df["_brand_lc"].tolist()
+
+    # Write to a temp file and swap it in, so readers never see a partial pickle
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(cache_path)), suffix=".tmp"
+        )
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump((df, names), f, protocol=5)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print("⚠️ Could not write med cache:", e)
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return df, names
+
+
+med_df, canon_names = load_meds()
+
+# Plain (brand, generic, price) tuples for the per-match lookup
+_MED_RECORDS = list(zip(
+    med_df["brand"].tolist(),
+    med_df["generic"].tolist(),
+    med_df["price"].astype(float).tolist(),
+))
+
+# ============================================================
+# PRECOMPILED PATTERNS
+# ============================================================
+_NONALNUM = re.compile(r"[^a-z0-9\s-]")
+_WS = re.compile(r"\s+")
+_TIMING_FIX = re.compile(r"[0-2]-[0-2]-?")
+_TIMING = re.compile(r"[0-2]-[0-2]-[0-2]")
+_DAYS = re.compile(r"(\d+)\s*day")
+_NUM = re.compile(r"(\d{1,2})")
 
 # ============================================================
 # RANDOM CONSISTENCY
 # ============================================================
-random.seed(42)
+_rng = np.random.default_rng(42)
 side_effect_pool = [
     "nausea", "headache", "dizziness", "stomach upset",
     "dry mouth", "loose motions", "sleepiness"
 ]
 avoid_pool = ["alcohol", "coffee", "junk food", "smoking", "cold drinks", "antibiotics"]
+_side_effect_arr = np.array(side_effect_pool, dtype=object)
+_avoid_arr = np.array(avoid_pool, dtype=object)
+
+
+def _sample_rows(pool, k, size):
+    # k independent draws of `size` distinct items, done as one matrix op
+    idx = np.argsort(_rng.random((k, len(pool))), axis=1)[:, :size]
+    return np.take(pool, idx).tolist()
 
 # ============================================================
 # CLEAN OCR LINES
 # ============================================================
+garbage_words = [
+    "hospital", "mbbs", "obg", "gyn", "paediatrics", "opp",
+    "road", "nagar", "reddy", "sudha", "doctor", "date"
+]
+
+replacements = {
+    "dolo-": "dolo 650",
+    "tombiflam": "combiflam",
+    "combiflem": "combiflam",
+    "combilam": "combiflam",
+    "epbin": "eptoin",
+    "eploin": "eptoin",
+    "i-0-1": "1-0-1",
+    "i-i-1": "1-1-1",
+    "l-0-1": "1-0-1"
+}
+
+# One pass per line instead of one scan per keyword
+_GARBAGE_RE = re.compile("|".join(re.escape(g) for g in garbage_words))
+_REPL_RE = re.compile(
+    "|".join(re.escape(k) for k in sorted(replacements, key=len, reverse=True))
+)
+
+
 def clean_ocr_lines(raw):
     cleaned = []
 
-    garbage_words = [
-        "hospital", "mbbs", "obg", "gyn", "paediatrics", "opp",
-        "road", "nagar", "reddy", "sudha", "doctor", "date"
-    ]
-
-    replacements = {
-        "dolo-": "dolo 650",
-        "tombiflam": "combiflam",
-        "combiflem": "combiflam",
-        "combilam": "combiflam",
-        "epbin": "eptoin",
-        "eploin": "eptoin",
-        "i-0-1": "1-0-1",
-        "i-i-1": "1-1-1",
-        "l-0-1": "1-0-1"
-    }
-
     for line in raw:
         t = line.lower().strip()
         if not t:
             continue
 
         # Skip hospital header
-        if any(g in t for g in garbage_words):
+        if _GARBAGE_RE.search(t):
             continue
 
         # Apply replacements
-        for wrong, correct in replacements.items():
-            t = t.replace(wrong, correct)
+        t = _REPL_RE.sub(lambda m: replacements[m.group(0)], t)
 
         # Remove garbage chars
-        t = re.sub(r"[^a-z0-9\s-]", " ", t)
-        t = re.sub(r"\s+", " ", t).strip()
+        t = _NONALNUM.sub(" ", t)
+        t = _WS.sub(" ", t).strip()
 
         # Fix broken timing patterns like "1-0-" → "1-0-1"
-        if re.fullmatch(r"[0-2]-[0-2]-?", t):
+        if _TIMING_FIX.fullmatch(t):
             parts = t.split("-")
             while len(parts) < 3:
                 parts.append("1")
@@ -88,7 +163,7 @@ def clean_ocr_lines(raw):
 def detect_timing(t):
     t = t.strip().lower()
 
-    if re.fullmatch(r"[0-2]-[0-2]-[0-2]", t):
+    if _TIMING.fullmatch(t):
         return t
     if t == "bd":
         return "1-0-1"
@@ -105,11 +180,11 @@ def detect_timing(t):
 def detect_duration(t):
     t = t.lower()
 
-    m = re.search(r"(\d+)\s*day", t)
+    m = _DAYS.search(t)
     if m:
         return int(m.group(1))
 
-    m = re.fullmatch(r"(\d{1,2})", t)
+    m = _NUM.fullmatch(t)
     if m:
         v = int(m.group(1))
         if 1 <= v <= 30:
@@ -121,18 +196,48 @@ def detect_duration(t):
 # SAFE MED MATCH
 # ============================================================
 def find_medicine_name(raw):
-    raw = raw.lower().strip()
-
-    if len(raw) < 3:
-        return None
-
-    best = process.extractOne(raw, canon_names, scorer=fuzz.WRatio)
-    if best:
-        match, score, idx = best
-        if score >= 88:
-            return idx
+    return find_medicine_names([raw])[0]
 
-    return None
+# ============================================================
+# BATCH MED MATCH — ONE cdist CALL FOR ALL LINES
+# ============================================================
+# canon_names is fixed after load, so the normalized line is a sound cache key
+_MATCH_CACHE_SIZE = 4096
+_match_cache = OrderedDict()
+_match_cache_lock = threading.Lock()
+
+
+def find_medicine_names(lines):
+    lines_lc = [l.lower().strip() for l in lines]
+
+    found = {}
+    misses = []
+    with _match_cache_lock:
+        for l in dict.fromkeys(l for l in lines_lc if len(l) >= 3):
+            if l in _match_cache:
+                _match_cache.move_to_end(l)
+                found[l] = _match_cache[l]
+            else:
+                misses.append(l)
+
+    # Score only lines not seen before, in one call
+    if misses:
+        scores = process.cdist(
+            misses, canon_names,
+            scorer=fuzz.WRatio, processor=None, score_cutoff=88, workers=-1
+        )
+        best_idx = scores.argmax(axis=1)
+        best_score = scores.max(axis=1)
+
+        with _match_cache_lock:
+            for k, l in enumerate(misses):
+                idx = int(best_idx[k]) if best_score[k] >= 88 else None
+                found[l] = idx
+                _match_cache[l] = idx
+            while len(_match_cache) > _MATCH_CACHE_SIZE:
+                _match_cache.popitem(last=False)
+
+    return [found.get(l) for l in lines_lc]
 
 # ============================================================
 # FINAL PARSER — 2 LINES BEFORE + 2 LINES AFTER CHECKING
@@ -141,17 +246,13 @@ def parse_prescription(lines):
     meds = []
     n = len(lines)
 
-    for i, line in enumerate(lines):
-        line = line.lower().strip()
-        idx = find_medicine_name(line)
+    med_idx = find_medicine_names(lines)
 
+    for i, idx in enumerate(med_idx):
         if idx is None:
             continue
 
-        row = med_df.iloc[idx]
-        brand = row["brand"]
-        generic = row["generic"]
-        price = float(row["price"])
+        brand, generic, price = _MED_RECORDS[idx]
 
         timing = None
         duration = None
@@ -191,8 +292,14 @@ def parse_prescription(lines):
             "price": price,
             "timing": timing,
             "duration": duration,
-            "side_effects": random.sample(side_effect_pool, 3),
-            "avoid_mixing": random.sample(avoid_pool, 2)
         })
 
+    k = len(meds)
+    if k:
+        side_effects = _sample_rows(_side_effect_arr, k, 3)
+        avoids = _sample_rows(_avoid_arr, k, 2)
+        for m, se, av in zip(meds, side_effects, avoids):
+            m["side_effects"] = se
+            m["avoid_mixing"] = av
+
     return meds